@@ -1,12 +1,17 @@
+import atexit
 import customtkinter as ctk
+import functools
+import queue
 import threading
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 import time
 from datetime import datetime
-from collections import deque
 import random
-import pandas as pd
+import sqlite3
+import numpy as np
 from pathlib import Path
+from dotenv import load_dotenv
 import os
 
 # Load variables from .env file
@@ -18,6 +23,17 @@ AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 CAREGIVER_ID = os.getenv("CAREGIVER_PHONE")
 
+# Fail fast on missing credentials instead of discovering them when the
+# first emergency call silently fails
+_missing = [name for name, value in [
+    ("TWILIO_ACCOUNT_SID", ACCOUNT_SID),
+    ("TWILIO_AUTH_TOKEN", AUTH_TOKEN),
+    ("TWILIO_PHONE_NUMBER", TWILIO_NUMBER),
+    ("CAREGIVER_PHONE", CAREGIVER_ID),
+] if not value]
+if _missing:
+    raise SystemExit(f"❌ Missing .env settings: {', '.join(_missing)}")
+
 
 # --- THRESHOLDS ---
 HEART_RATE_CRITICAL = 140
@@ -27,35 +43,124 @@ SPO2_WARNING = 93
 TEMP_CRITICAL_HIGH = 38.5
 TEMP_CRITICAL_LOW = 35.5
 
-# Auto-call cooldown (prevent spam)
-LAST_AUTO_CALL = None
-AUTO_CALL_COOLDOWN = 30  # seconds between auto-calls
+# Auto-call cooldown (prevent spam), tracked per alert type on the
+# monotonic clock so wall-clock adjustments can't shrink or stretch it
+# and a recent HEART alert doesn't suppress an unrelated SPO2 one
+LAST_AUTO_CALL = {}
+AUTO_CALL_COOLDOWN = 30  # seconds between auto-calls of the same type
+
+# Sensor simulation cadence
+SENSOR_INTERVAL_MS = 3000
+
+TIMESTAMP_FMT = "%Y-%m-%d %H:%M:%S"
+
+# Voice message template (Arabic), built once; only the per-alert fields
+# are substituted at call time
+TWIML_TEMPLATE = """
+<Response>
+    <Say voice="Polly.Zeina" language="ar-SA">
+        نظام رفيق للمراقبة الصحية.
+        تنبيه عاجل.
+        {reason}.
+        معدل النبض {hr}.
+        الأكسجين {spo2} بالمئة.
+        درجة الحرارة {temp}.
+        يرجى التحقق من حالة المريض فوراً.
+    </Say>
+</Response>
+"""
+
+# Call counter shared by the auto-alert and manual-alert threads;
+# never parse it back out of the GUI label
+_CALL_COUNT = 0
+_CALL_COUNT_LOCK = threading.Lock()
+
+
+def next_call_count():
+    global _CALL_COUNT
+    with _CALL_COUNT_LOCK:
+        _CALL_COUNT += 1
+        return _CALL_COUNT
+
+
+def reset_call_count():
+    global _CALL_COUNT
+    with _CALL_COUNT_LOCK:
+        _CALL_COUNT = 0
+
+
+# Shared Twilio client (HTTP session/TLS setup is reusable across calls)
+_TWILIO_CLIENT = None
+
+
+def get_twilio_client():
+    global _TWILIO_CLIENT
+    if _TWILIO_CLIENT is None:
+        # pool_connections keeps one requests.Session alive underneath,
+        # so back-to-back alerts reuse the same TLS connection
+        http_client = TwilioHttpClient(pool_connections=True, max_retries=3)
+        _TWILIO_CLIENT = Client(ACCOUNT_SID, AUTH_TOKEN, http_client=http_client)
+    return _TWILIO_CLIENT
+
+
+def update_widget(widget, **kwargs):
+    """Marshal a widget.configure onto the Tk main loop.
+
+    Tk is not thread-safe; worker threads must never touch widgets
+    directly, so schedule the configure via after(0, ...) instead.
+    """
+    widget.after(0, lambda: widget.configure(**kwargs))
 
 
 # --- EMOTION ANALYSIS ENGINE ---
 class EmotionAnalyzer:
     """Simple rule-based emotion detection from vital signs"""
 
+    # Scoring bands, most severe first: (threshold, points, factor)
+    HR_BANDS = ((130, 30, "elevated_hr"), (110, 15, "raised_hr"))
+    SPO2_BANDS = ((92, 25, "low_oxygen"), (95, 10, "reduced_oxygen"))
+
+    # Classification bands, highest score first: (min_score, emotion, color)
+    EMOTION_BANDS = (
+        (60, "CRITICAL DISTRESS", "#D50000"),
+        (40, "HIGH ANXIETY", "#FF6D00"),
+        (25, "MODERATE STRESS", "#FFA000"),
+        (10, "MILD DISCOMFORT", "#FBC02D"),
+        (0, "STABLE", "#00C853"),
+    )
+
     @staticmethod
     def analyze(heart_rate, spo2, temp, fall_detected, help_pressed):
+        """Score a reading; returns a fresh dict so callers can't
+        mutate the cached result behind the cache's back"""
+        emotion, score, color, factors = EmotionAnalyzer._analyze_cached(
+            heart_rate, spo2, temp, fall_detected, help_pressed)
+        return {
+            "emotion": emotion,
+            "score": score,
+            "color": color,
+            "factors": list(factors)
+        }
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _analyze_cached(heart_rate, spo2, temp, fall_detected, help_pressed):
         score = 0
         factors = []
 
         # Heart Rate Analysis
-        if heart_rate > 130:
-            score += 30
-            factors.append("elevated_hr")
-        elif heart_rate > 110:
-            score += 15
-            factors.append("raised_hr")
+        for threshold, points, factor in EmotionAnalyzer.HR_BANDS:
+            if heart_rate > threshold:
+                score += points
+                factors.append(factor)
+                break
 
         # SpO2 Analysis
-        if spo2 < 92:
-            score += 25
-            factors.append("low_oxygen")
-        elif spo2 < 95:
-            score += 10
-            factors.append("reduced_oxygen")
+        for threshold, points, factor in EmotionAnalyzer.SPO2_BANDS:
+            if spo2 < threshold:
+                score += points
+                factors.append(factor)
+                break
 
         # Temperature Analysis
         if temp > 38 or temp < 36:
@@ -72,176 +177,224 @@ class EmotionAnalyzer:
             factors.append("distress_signal")
 
         # Emotion Classification
-        if score >= 60:
-            emotion = "CRITICAL DISTRESS"
-            color = "#D50000"
-        elif score >= 40:
-            emotion = "HIGH ANXIETY"
-            color = "#FF6D00"
-        elif score >= 25:
-            emotion = "MODERATE STRESS"
-            color = "#FFA000"
-        elif score >= 10:
-            emotion = "MILD DISCOMFORT"
-            color = "#FBC02D"
-        else:
-            emotion = "STABLE"
-            color = "#00C853"
+        for min_score, emotion, color in EmotionAnalyzer.EMOTION_BANDS:
+            if score >= min_score:
+                break
 
-        return {
-            "emotion": emotion,
-            "score": score,
-            "color": color,
-            "factors": factors
-        }
+        # Immutable so a cached hit can be shared safely
+        return emotion, score, color, tuple(factors)
 
 
 # --- DATA MANAGER (Time Series + Excel Export) ---
-class VitalSignsMonitor:
-    def __init__(self):
-        # Emergency Events
-        self.fall_events = []
-        self.help_requests = []
-        self.emergency_calls = []
+def _resolve_save_location():
+    """Pick the first existing directory for the monitor's data files"""
+    possible_paths = [
+        Path.home() / "Desktop",
+        Path.home() / "OneDrive" / "Desktop",
+        Path.home() / "OneDrive" / "سطح المكتب",  # Arabic Desktop
+        Path.home() / "سطح المكتب",  # Arabic Desktop direct
+        Path.home() / "Documents",
+        Path.home()  # Home directory as fallback
+    ]
 
-        # Excel Export Path - Try multiple locations
-        possible_paths = [
-            Path.home() / "Desktop",
-            Path.home() / "OneDrive" / "Desktop",
-            Path.home() / "OneDrive" / "سطح المكتب",  # Arabic Desktop
-            Path.home() / "سطح المكتب",  # Arabic Desktop direct
-            Path.home() / "Documents",
-            Path.home()  # Home directory as fallback
-        ]
-
-        # Find first existing directory
-        save_location = None
-        for path in possible_paths:
-            if path.exists():
-                save_location = path
-                break
-
-        if save_location is None:
-            save_location = Path.home()
-            save_location.mkdir(exist_ok=True)
-
-        self.excel_file = save_location / "Rafeeq_Continuous_Monitor.xlsx"
-        print(f"📂 Excel file will be saved to: {self.excel_file}")
+    for path in possible_paths:
+        if path.exists():
+            return path
 
-        # Initialize Excel file with headers if doesn't exist
-        self.init_excel_file()
+    fallback = Path.home()
+    fallback.mkdir(exist_ok=True)
+    return fallback
 
-    def init_excel_file(self):
-        """Create Excel file with all sheets if it doesn't exist"""
-        if not self.excel_file.exists():
-            with pd.ExcelWriter(self.excel_file, engine='openpyxl') as writer:
-                # Vital Signs Sheet
-                pd.DataFrame(columns=[
-                    'Timestamp', 'Heart_Rate_BPM', 'SpO2_Percent',
-                    'Temperature_Celsius', 'Emotional_State', 'Emotion_Score'
-                ]).to_excel(writer, sheet_name='Vital_Signs', index=False)
 
-                # Emergency Calls Sheet
-                pd.DataFrame(columns=[
-                    'Timestamp', 'Alert_Type', 'Heart_Rate', 'SpO2',
-                    'Temperature', 'Emotion_State', 'Auto_Triggered'
-                ]).to_excel(writer, sheet_name='Emergency_Calls', index=False)
+# Resolved once at import; the directory doesn't change while running
+SAVE_LOCATION = _resolve_save_location()
 
-                # Fall Events Sheet
-                pd.DataFrame(columns=['Fall_Timestamp']).to_excel(
-                    writer, sheet_name='Fall_Events', index=False)
 
-                # Help Requests Sheet
-                pd.DataFrame(columns=['Help_Request_Timestamp']).to_excel(
-                    writer, sheet_name='Help_Requests', index=False)
-
-            print(f"✅ Excel file created at: {self.excel_file}")
+class VitalSignsMonitor:
+    def __init__(self):
+        # Emergency Events
+        self.fall_events = []
+        self.help_requests = []
+        self.emergency_calls = []
 
-    def append_vital_reading(self, hr, spo2, temp, emotion, score):
-        """Append a single vital sign reading to Excel"""
+        self.db_file = SAVE_LOCATION / "Rafeeq_Continuous_Monitor.db"
+        self.excel_file = SAVE_LOCATION / "Rafeeq_Continuous_Monitor.xlsx"
+        print(f"📂 Database will be saved to: {self.db_file}")
+
+        # SQLite sink: a single prepared INSERT per reading instead of
+        # re-serialising an xlsx workbook on every tick
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self._db_lock = threading.Lock()
+
+        self.init_db()
+
+        # Vital readings go through a bounded queue drained by a dedicated
+        # writer thread, so the sensor/GUI threads never wait on disk.
+        # The writer flushes every N readings or T seconds, whichever
+        # comes first. The in-progress batch lives on the object (not in
+        # the writer's locals) so _drain_queue can always reach it.
+        self.flush_every = 20
+        self.flush_interval = 30  # seconds
+        self._queue = queue.Queue(maxsize=1024)
+        self._batch = []
+        self._batch_lock = threading.Lock()
+        threading.Thread(target=self._writer_loop, daemon=True).start()
+
+        # Flush whatever is still queued when the app exits
+        atexit.register(self._drain_queue)
+
+    def init_db(self):
+        """Create the logging tables if they don't exist"""
+        with self._db_lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS vital_signs (
+                    timestamp TEXT, heart_rate_bpm INTEGER, spo2_percent INTEGER,
+                    temperature_celsius REAL, emotional_state TEXT, emotion_score INTEGER
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS emergency_calls (
+                    timestamp TEXT, alert_type TEXT, heart_rate INTEGER, spo2 INTEGER,
+                    temperature REAL, emotion_state TEXT, auto_triggered TEXT
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS fall_events (fall_timestamp TEXT)""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS help_requests (help_request_timestamp TEXT)""")
+
+    def append_vital_reading(self, hr, spo2, temp, emotion, score, ts=None):
+        """Hand a single vital sign reading to the writer thread"""
         try:
-            new_row = pd.DataFrame([{
-                'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'Heart_Rate_BPM': hr,
-                'SpO2_Percent': spo2,
-                'Temperature_Celsius': temp,
-                'Emotional_State': emotion,
-                'Emotion_Score': score
-            }])
-
-            # Read existing data
-            existing_df = pd.read_excel(self.excel_file, sheet_name='Vital_Signs')
-
-            # Append new row
-            updated_df = pd.concat([existing_df, new_row], ignore_index=True)
-
-            # Write back (preserving other sheets)
-            with pd.ExcelWriter(self.excel_file, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                updated_df.to_excel(writer, sheet_name='Vital_Signs', index=False)
+            self._queue.put_nowait(
+                (ts or datetime.now().strftime(TIMESTAMP_FMT),
+                 hr, spo2, temp, emotion, score))
+        except queue.Full:
+            print("⚠️ Vital-sign queue full, dropping reading")
+
+    def _writer_loop(self):
+        """Drain the reading queue into the shared batch and flush it"""
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                row = self._queue.get(timeout=timeout)
+                with self._batch_lock:
+                    self._batch.append(row)
+                    pending = len(self._batch)
+            except queue.Empty:
+                with self._batch_lock:
+                    pending = len(self._batch)
+
+            if pending >= self.flush_every or time.monotonic() >= deadline:
+                if pending:
+                    self._drain_queue()
+                deadline = time.monotonic() + self.flush_interval
+
+    def _drain_queue(self):
+        """Flush the in-progress batch plus anything still queued.
+
+        Shared by the writer thread, the atexit hook and the Excel
+        export, so readings can't be stranded in the writer's batch.
+        """
+        with self._batch_lock:
+            while True:
+                try:
+                    self._batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch, self._batch = self._batch, []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """Write a batch of readings in one transaction"""
+        try:
+            with self._db_lock, self.conn:
+                self.conn.executemany(
+                    "INSERT INTO vital_signs VALUES (?, ?, ?, ?, ?, ?)",
+                    batch)
 
         except Exception as e:
-            print(f"❌ Error appending vital reading: {e}")
+            print(f"❌ Error flushing vital readings: {e}")
 
-    def append_emergency_call(self, alert_type, hr, spo2, temp, emotion, auto_triggered=False):
-        """Append emergency call to Excel"""
+    def append_emergency_call(self, alert_type, hr, spo2, temp, emotion,
+                              auto_triggered=False, ts=None):
+        """Log an emergency call"""
         try:
-            new_row = pd.DataFrame([{
-                'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'Alert_Type': alert_type,
-                'Heart_Rate': hr,
-                'SpO2': spo2,
-                'Temperature': temp,
-                'Emotion_State': emotion,
-                'Auto_Triggered': 'YES' if auto_triggered else 'NO'
-            }])
-
-            existing_df = pd.read_excel(self.excel_file, sheet_name='Emergency_Calls')
-            updated_df = pd.concat([existing_df, new_row], ignore_index=True)
-
-            with pd.ExcelWriter(self.excel_file, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                updated_df.to_excel(writer, sheet_name='Emergency_Calls', index=False)
+            with self._db_lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO emergency_calls VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (ts or datetime.now().strftime(TIMESTAMP_FMT),
+                     alert_type, hr, spo2, temp, emotion,
+                     'YES' if auto_triggered else 'NO'))
 
         except Exception as e:
             print(f"❌ Error appending emergency call: {e}")
 
-    def append_fall_event(self):
-        """Append fall event to Excel"""
+    def append_fall_event(self, ts=None):
+        """Log a fall event"""
         try:
-            new_row = pd.DataFrame([{
-                'Fall_Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }])
-
-            existing_df = pd.read_excel(self.excel_file, sheet_name='Fall_Events')
-            updated_df = pd.concat([existing_df, new_row], ignore_index=True)
-
-            with pd.ExcelWriter(self.excel_file, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                updated_df.to_excel(writer, sheet_name='Fall_Events', index=False)
+            with self._db_lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO fall_events VALUES (?)",
+                    (ts or datetime.now().strftime(TIMESTAMP_FMT),))
 
         except Exception as e:
             print(f"❌ Error appending fall event: {e}")
 
-    def append_help_request(self):
-        """Append help request to Excel"""
+    def append_help_request(self, ts=None):
+        """Log a help request"""
         try:
-            new_row = pd.DataFrame([{
-                'Help_Request_Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }])
+            with self._db_lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO help_requests VALUES (?)",
+                    (ts or datetime.now().strftime(TIMESTAMP_FMT),))
 
-            existing_df = pd.read_excel(self.excel_file, sheet_name='Help_Requests')
-            updated_df = pd.concat([existing_df, new_row], ignore_index=True)
+        except Exception as e:
+            print(f"❌ Error appending help request: {e}")
 
-            with pd.ExcelWriter(self.excel_file, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                updated_df.to_excel(writer, sheet_name='Help_Requests', index=False)
+    EXPORT_SHEETS = [
+        ('vital_signs', 'Vital_Signs',
+         ['Timestamp', 'Heart_Rate_BPM', 'SpO2_Percent',
+          'Temperature_Celsius', 'Emotional_State', 'Emotion_Score']),
+        ('emergency_calls', 'Emergency_Calls',
+         ['Timestamp', 'Alert_Type', 'Heart_Rate', 'SpO2',
+          'Temperature', 'Emotion_State', 'Auto_Triggered']),
+        ('fall_events', 'Fall_Events', ['Fall_Timestamp']),
+        ('help_requests', 'Help_Requests', ['Help_Request_Timestamp']),
+    ]
+
+    def export_to_excel(self):
+        """One-shot dump of the database into the Excel report"""
+        import openpyxl  # only needed for the on-demand export
+
+        self._drain_queue()
+        try:
+            with self._db_lock:
+                # write_only streams rows straight to disk instead of
+                # building the whole workbook in memory; openpyxl picks
+                # up lxml automatically when it's installed
+                wb = openpyxl.Workbook(write_only=True)
+                for table, sheet, headers in self.EXPORT_SHEETS:
+                    ws = wb.create_sheet(sheet)
+                    ws.append(headers)
+                    for row in self.conn.execute(f"SELECT * FROM {table}"):
+                        ws.append(row)
+                wb.save(self.excel_file)
+
+            print(f"✅ Excel report exported to: {self.excel_file}")
+            return True
 
         except Exception as e:
-            print(f"❌ Error appending help request: {e}")
+            print(f"❌ Error exporting to Excel: {e}")
+            return False
 
 
 # --- EMERGENCY CALL HANDLER ---
 def trigger_emergency_call(alert_type, sensor_data, status_label, call_counter_label, monitor, auto_triggered=False):
-    global LAST_AUTO_CALL
-
-    client = Client(ACCOUNT_SID, AUTH_TOKEN)
+    client = get_twilio_client()
 
     # Get current vitals
     hr = sensor_data.get('hr', 0)
@@ -253,20 +406,24 @@ def trigger_emergency_call(alert_type, sensor_data, status_label, call_counter_l
     # Emotion Analysis
     emotion_state = EmotionAnalyzer.analyze(hr, spo2, temp, fall, help_btn)
 
-    # Log to Excel
-    monitor.append_emergency_call(alert_type, hr, spo2, temp, emotion_state['emotion'], auto_triggered)
+    # One timestamp per alert, shared by every record it produces
+    ts = datetime.now().strftime(TIMESTAMP_FMT)
+
+    # Log the call
+    monitor.append_emergency_call(alert_type, hr, spo2, temp,
+                                  emotion_state['emotion'], auto_triggered, ts)
 
     # Build Arabic Message
     auto_prefix = "تنبيه تلقائي. " if auto_triggered else ""
 
     if alert_type == "HELP":
         reason = f"{auto_prefix}المريض يطلب المساعدة. الحالة النفسية: {emotion_state['emotion']}"
-        monitor.append_help_request()
+        monitor.append_help_request(ts)
     elif alert_type == "HEART":
         reason = f"{auto_prefix}دقات القلب {hr}. أعلى من الحد الطبيعي"
     elif alert_type == "FALL":
         reason = f"{auto_prefix}كشف السقوط. تحتاج إلى مساعدة فورية"
-        monitor.append_fall_event()
+        monitor.append_fall_event(ts)
     elif alert_type == "SPO2":
         reason = f"{auto_prefix}مستوى الأكسجين منخفض. {spo2} بالمئة"
     elif alert_type == "TEMP":
@@ -276,26 +433,13 @@ def trigger_emergency_call(alert_type, sensor_data, status_label, call_counter_l
 
     # Update GUI
     auto_text = " [AUTO-TRIGGERED]" if auto_triggered else ""
-    status_label.configure(
-        text=f"🚨 {alert_type} ALERT{auto_text} | Emotion: {emotion_state['emotion']}",
-        text_color=emotion_state['color']
-    )
+    update_widget(status_label,
+                  text=f"🚨 {alert_type} ALERT{auto_text} | Emotion: {emotion_state['emotion']}",
+                  text_color=emotion_state['color'])
 
     # Make Voice Call
     try:
-        twiml_msg = f"""
-        <Response>
-            <Say voice="Polly.Zeina" language="ar-SA">
-                نظام رفيق للمراقبة الصحية.
-                تنبيه عاجل.
-                {reason}.
-                معدل النبض {hr}.
-                الأكسجين {spo2} بالمئة.
-                درجة الحرارة {temp}.
-                يرجى التحقق من حالة المريض فوراً.
-            </Say>
-        </Response>
-        """
+        twiml_msg = TWIML_TEMPLATE.format(reason=reason, hr=hr, spo2=spo2, temp=temp)
         call = client.calls.create(
             to=CAREGIVER_ID,
             from_=TWILIO_NUMBER,
@@ -304,122 +448,18 @@ def trigger_emergency_call(alert_type, sensor_data, status_label, call_counter_l
         print(f"📞 {'[AUTO] ' if auto_triggered else ''}Call Initiated: {call.sid}")
 
         # Increment Call Counter
-        current = int(call_counter_label.cget("text").split(":")[1].strip())
-        call_counter_label.configure(text=f"Total Calls: {current + 1}")
+        update_widget(call_counter_label, text=f"Total Calls: {next_call_count()}")
 
-        # Update last auto-call time
+        # Update last auto-call time for this alert type
         if auto_triggered:
-            LAST_AUTO_CALL = time.time()
+            LAST_AUTO_CALL[alert_type] = time.monotonic()
 
     except Exception as e:
         print(f"❌ Call Failed: {e}")
-        status_label.configure(text=f"⚠️ Call Error: {str(e)}", text_color="#FF5252")
+        update_widget(status_label, text=f"⚠️ Call Error: {str(e)}", text_color="#FF5252")
 
     time.sleep(2)
-    status_label.configure(text="✅ Alert Processed. Monitoring...", text_color="#00E676")
-
-
-# --- SENSOR SIMULATOR WITH AUTO-ALERT ---
-def simulate_sensor_readings(monitor, hr_label, spo2_label, temp_label, emotion_label,
-                             trend_label, status_label, call_counter_label, unstable_case_label):
-    """Continuous background simulation with random spikes and auto-alerts"""
-    global LAST_AUTO_CALL
-
-    # Base values (normal range)
-    base_hr = 75
-    base_spo2 = 97
-    base_temp = 36.8
-
-    reading_count = 0
-
-    while True:
-        reading_count += 1
-
-        # Normal variation
-        hr = base_hr + random.randint(-5, 5)
-        spo2 = base_spo2 + random.randint(-1, 1)
-        temp = round(base_temp + random.uniform(-0.2, 0.2), 1)
-
-        # RANDOM SPIKE GENERATION (Every 15-30 readings)
-        should_spike = random.randint(1, 25) == 1  # ~4% chance each reading
-
-        if should_spike:
-            spike_type = random.choice(['HEART', 'SPO2', 'TEMP'])
-
-            if spike_type == 'HEART':
-                hr = random.randint(145, 165)  # Critical heart rate
-            elif spike_type == 'SPO2':
-                spo2 = random.randint(85, 91)  # Critical low oxygen
-            elif spike_type == 'TEMP':
-                temp = round(random.uniform(38.6, 39.5), 1)  # High fever
-
-        # Emotion Analysis
-        emotion = EmotionAnalyzer.analyze(hr, spo2, temp, False, False)
-
-        # Save to Excel (every reading)
-        monitor.append_vital_reading(hr, spo2, temp, emotion['emotion'], emotion['score'])
-
-        # Update GUI
-        hr_label.configure(text=f"❤️ Heart Rate: {hr} BPM")
-        spo2_label.configure(text=f"🫁 SpO2: {spo2}%")
-        temp_label.configure(text=f"🌡️ Temperature: {temp}°C")
-
-        emotion_label.configure(
-            text=f"🧠 Emotional State: {emotion['emotion']}",
-            text_color=emotion['color']
-        )
-
-        # Update trend placeholder
-        trend_label.configure(text=f"📊 Reading #{reading_count}")
-
-        # DISPLAY UNSTABLE CASES
-        unstable_factors = []
-        if hr > HEART_RATE_WARNING:
-            unstable_factors.append(f"High HR ({hr})")
-        if spo2 < SPO2_WARNING:
-            unstable_factors.append(f"Low O2 ({spo2}%)")
-        if temp > TEMP_CRITICAL_HIGH or temp < TEMP_CRITICAL_LOW:
-            unstable_factors.append(f"Abnormal Temp ({temp}°C)")
-
-        if emotion['emotion'] != "STABLE":
-            case_text = f"⚠️ UNSTABLE: {emotion['emotion']} | Factors: {', '.join(unstable_factors) if unstable_factors else 'Emotional stress detected'}"
-            unstable_case_label.configure(text=case_text, text_color=emotion['color'])
-        else:
-            unstable_case_label.configure(text="✅ Patient Status: STABLE", text_color="#00C853")
-
-        # AUTO-TRIGGER EMERGENCY CALL IF CRITICAL
-        if should_spike or emotion['score'] >= 25:
-            # Check cooldown
-            current_time = time.time()
-            if LAST_AUTO_CALL is None or (current_time - LAST_AUTO_CALL) >= AUTO_CALL_COOLDOWN:
-
-                # Determine alert type
-                if hr > HEART_RATE_CRITICAL:
-                    alert_type = "HEART"
-                elif spo2 < SPO2_CRITICAL:
-                    alert_type = "SPO2"
-                elif temp > TEMP_CRITICAL_HIGH:
-                    alert_type = "TEMP"
-                else:
-                    alert_type = "GENERAL"
-
-                sensor_data = {
-                    'hr': hr,
-                    'spo2': spo2,
-                    'temp': temp,
-                    'fall': False,
-                    'help': False
-                }
-
-                print(f"🔔 AUTO-ALERT TRIGGERED: {alert_type} | HR={hr}, SpO2={spo2}, Temp={temp}")
-
-                # Trigger call in separate thread
-                threading.Thread(target=trigger_emergency_call,
-                                 args=(alert_type, sensor_data, status_label,
-                                       call_counter_label, monitor, True),
-                                 daemon=True).start()
-
-        time.sleep(3)  # Update every 3 seconds
+    update_widget(status_label, text="✅ Alert Processed. Monitoring...", text_color="#00E676")
 
 
 # --- MAIN GUI ---
@@ -439,11 +479,11 @@ class RafeeqAdvancedSystem(ctk.CTk):
                               font=("Arial", 32, "bold"), text_color="#00E676")
         header.pack(pady=15)
 
-        # Excel File Location
-        excel_path_label = ctk.CTkLabel(self,
-                                        text=f"📁 Excel File: {self.monitor.excel_file.name}",
-                                        font=("Arial", 11), text_color="#64B5F6")
-        excel_path_label.pack()
+        # Database Location
+        db_path_label = ctk.CTkLabel(self,
+                                     text=f"📁 Database: {self.monitor.db_file.name}",
+                                     font=("Arial", 11), text_color="#64B5F6")
+        db_path_label.pack()
 
         # Status Bar
         self.status_label = ctk.CTkLabel(self, text="✅ SYSTEM ACTIVE - MONITORING PATIENT",
@@ -528,17 +568,164 @@ class RafeeqAdvancedSystem(ctk.CTk):
                       fg_color="#BF360C", height=50, font=("Arial", 14, "bold"),
                       command=lambda: self.trigger_alert("TEMP", 98, 96, 39.2)).pack(pady=6, fill="x", padx=40)
 
+        # Export to Excel
+        ctk.CTkButton(btn_frame, text="📊 EXPORT TO EXCEL",
+                      fg_color="#1565C0", height=40,
+                      command=self.export_report).pack(pady=(15, 5))
+
         # Reset
         ctk.CTkButton(btn_frame, text="♻️ RESET CALL COUNTER",
                       fg_color="#00C853", height=40,
-                      command=self.reset_counter).pack(pady=15)
+                      command=self.reset_counter).pack(pady=(5, 15))
+
+        # --- SENSOR SIMULATOR STATE ---
+        # Base values (normal range)
+        self.base_hr = 75
+        self.base_spo2 = 97
+        self.base_temp = 36.8
+        self.reading_count = 0
+        # Labels are built showing the stable state
+        self._was_stable = True
+
+        # Precompute random variation in batches: one vectorised draw
+        # every batch_size ticks instead of four scalar draws per tick
+        self._rng = np.random.default_rng()
+        self._batch_size = 256
+        self._noise_idx = self._batch_size  # force a refill on the first tick
+        self._hr_noise = self._spo2_noise = None
+        self._temp_noise = self._spike_roll = None
+
+        # Start sensor simulation with auto-alerts on the Tk event loop
+        self.after(SENSOR_INTERVAL_MS, self._sensor_tick)
+
+    def _sensor_tick(self):
+        """One simulated sensor reading; reschedules itself every 3 s.
+
+        Runs on the Tk event loop, so labels are configured directly;
+        only the emergency call (network I/O) leaves this thread.
+        """
+        self.reading_count += 1
 
-        # Start background sensor simulation with auto-alerts
-        threading.Thread(target=simulate_sensor_readings,
-                         args=(self.monitor, self.hr_label, self.spo2_label,
-                               self.temp_label, self.emotion_label, self.trend_label,
-                               self.status_label, self.call_counter, self.unstable_case_label),
-                         daemon=True).start()
+        if self._noise_idx >= self._batch_size:
+            self._hr_noise = self._rng.integers(-5, 6, self._batch_size)
+            self._spo2_noise = self._rng.integers(-1, 2, self._batch_size)
+            self._temp_noise = self._rng.uniform(-0.2, 0.2, self._batch_size)
+            self._spike_roll = self._rng.integers(1, 26, self._batch_size)
+            self._noise_idx = 0
+
+        # Normal variation
+        hr = self.base_hr + int(self._hr_noise[self._noise_idx])
+        spo2 = self.base_spo2 + int(self._spo2_noise[self._noise_idx])
+        temp = round(self.base_temp + float(self._temp_noise[self._noise_idx]), 1)
+
+        # RANDOM SPIKE GENERATION (Every 15-30 readings)
+        should_spike = self._spike_roll[self._noise_idx] == 1  # ~4% chance each reading
+        self._noise_idx += 1
+
+        if should_spike:
+            spike_type = random.choice(['HEART', 'SPO2', 'TEMP'])
+
+            if spike_type == 'HEART':
+                hr = random.randint(145, 165)  # Critical heart rate
+            elif spike_type == 'SPO2':
+                spo2 = random.randint(85, 91)  # Critical low oxygen
+            elif spike_type == 'TEMP':
+                temp = round(random.uniform(38.6, 39.5), 1)  # High fever
+
+        # Emotion Analysis
+        emotion = EmotionAnalyzer.analyze(hr, spo2, temp, False, False)
+
+        # One timestamp per tick
+        ts = datetime.now().strftime(TIMESTAMP_FMT)
+
+        # Log every reading
+        self.monitor.append_vital_reading(hr, spo2, temp, emotion['emotion'],
+                                          emotion['score'], ts)
+
+        # Update GUI (the live numbers change every tick)
+        self.hr_label.configure(text=f"❤️ Heart Rate: {hr} BPM")
+        self.spo2_label.configure(text=f"🫁 SpO2: {spo2}%")
+        self.temp_label.configure(text=f"🌡️ Temperature: {temp}°C")
+
+        # Update trend placeholder
+        self.trend_label.configure(text=f"📊 Reading #{self.reading_count}")
+
+        # STABLE FAST PATH: ~96% of ticks. Skip building the factor list,
+        # skip the alert machinery, and only touch the emotion/status
+        # labels on the transition back to stable - their text doesn't
+        # change while the patient stays stable.
+        critical = (hr > HEART_RATE_CRITICAL,
+                    spo2 < SPO2_CRITICAL,
+                    temp > TEMP_CRITICAL_HIGH)
+
+        if (emotion['emotion'] == "STABLE" and not should_spike
+                and not any(critical)):
+            if not self._was_stable:
+                self.emotion_label.configure(text="🧠 Emotional State: STABLE",
+                                             text_color="#00C853")
+                self.unstable_case_label.configure(text="✅ Patient Status: STABLE",
+                                                   text_color="#00C853")
+                self._was_stable = True
+
+            self.after(SENSOR_INTERVAL_MS, self._sensor_tick)  # Update every 3 seconds
+            return
+
+        self._was_stable = False
+
+        self.emotion_label.configure(
+            text=f"🧠 Emotional State: {emotion['emotion']}",
+            text_color=emotion['color'])
+
+        # DISPLAY UNSTABLE CASES
+        unstable_factors = []
+        if hr > HEART_RATE_WARNING:
+            unstable_factors.append(f"High HR ({hr})")
+        if spo2 < SPO2_WARNING:
+            unstable_factors.append(f"Low O2 ({spo2}%)")
+        if temp > TEMP_CRITICAL_HIGH or temp < TEMP_CRITICAL_LOW:
+            unstable_factors.append(f"Abnormal Temp ({temp}°C)")
+
+        if emotion['emotion'] != "STABLE":
+            case_text = f"⚠️ UNSTABLE: {emotion['emotion']} | Factors: {', '.join(unstable_factors) if unstable_factors else 'Emotional stress detected'}"
+            self.unstable_case_label.configure(text=case_text, text_color=emotion['color'])
+        else:
+            self.unstable_case_label.configure(text="✅ Patient Status: STABLE",
+                                               text_color="#00C853")
+
+        # AUTO-TRIGGER EMERGENCY CALL IF CRITICAL
+        if any(critical) or should_spike or emotion['score'] >= 25:
+            # Determine alert type from the precomputed flags
+            hr_critical, spo2_critical, temp_critical = critical
+            if hr_critical:
+                alert_type = "HEART"
+            elif spo2_critical:
+                alert_type = "SPO2"
+            elif temp_critical:
+                alert_type = "TEMP"
+            else:
+                alert_type = "GENERAL"
+
+            # Check the cooldown for this alert type only
+            last_call = LAST_AUTO_CALL.get(alert_type)
+            if last_call is None or (time.monotonic() - last_call) >= AUTO_CALL_COOLDOWN:
+
+                sensor_data = {
+                    'hr': hr,
+                    'spo2': spo2,
+                    'temp': temp,
+                    'fall': False,
+                    'help': False
+                }
+
+                print(f"🔔 AUTO-ALERT TRIGGERED: {alert_type} | HR={hr}, SpO2={spo2}, Temp={temp}")
+
+                # Trigger call in separate thread
+                threading.Thread(target=trigger_emergency_call,
+                                 args=(alert_type, sensor_data, self.status_label,
+                                       self.call_counter, self.monitor, True),
+                                 daemon=True).start()
+
+        self.after(SENSOR_INTERVAL_MS, self._sensor_tick)  # Update every 3 seconds
 
     def trigger_alert(self, alert_type, hr, spo2, temp, fall=False, help=False):
         sensor_data = {
@@ -555,7 +742,17 @@ class RafeeqAdvancedSystem(ctk.CTk):
                                self.call_counter, self.monitor, False),
                          daemon=True).start()
 
+    def export_report(self):
+        if self.monitor.export_to_excel():
+            self.status_label.configure(
+                text=f"📊 Report exported to {self.monitor.excel_file.name}",
+                text_color="#64B5F6")
+        else:
+            self.status_label.configure(text="⚠️ Excel export failed",
+                                        text_color="#FF5252")
+
     def reset_counter(self):
+        reset_call_count()
         self.call_counter.configure(text="Total Calls: 0")
         self.status_label.configure(text="✅ SYSTEM ACTIVE - MONITORING PATIENT",
                                     text_color="#00E676")